@@ -6,60 +6,149 @@ Video Proxy + FFmpeg Audio/Subtitle Extraction
 
 import os
 import re
-import json
+import select
 import socket
 import subprocess
-from urllib.parse import urlparse, unquote
-from ipaddress import ip_address, ip_network
+import sys
+import threading
+from types import MappingProxyType
+from functools import lru_cache
+from urllib.parse import urlparse
+from ipaddress import ip_address
 from flask import Flask, request, Response, render_template, jsonify, stream_with_context
-import requests
+from flask.json.provider import JSONProvider
+import orjson
+import httpx
+from cachetools import TTLCache
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson."""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key')
 
 # ============================================
 # Configuration
 # ============================================
-CHUNK_SIZE = 8192
+CHUNK_SIZE = 131072
+PIPE_READ_SIZE = 262144
+PIPE_BUFFER_SIZE = 1 << 20
+PIPE_BURST_SIZE = 1 << 20
+F_SETPIPE_SZ = getattr(fcntl, 'F_SETPIPE_SZ', 1031)  # Linux-only, in fcntl since 3.10
 REQUEST_TIMEOUT = 30
-
-BLOCKED_NETWORKS = [
-    ip_network('127.0.0.0/8'),
-    ip_network('10.0.0.0/8'),
-    ip_network('172.16.0.0/12'),
-    ip_network('192.168.0.0/16'),
-    ip_network('169.254.0.0/16'),
-    ip_network('::1/128'),
-    ip_network('fc00::/7'),
-    ip_network('fe80::/10'),
-]
+FFMPEG_STOP_TIMEOUT = 2
+
+PROXY_REQUEST_HEADERS = MappingProxyType({
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': '*/*',
+    'Accept-Encoding': 'identity',
+})
+
+PROXY_RESPONSE_HEADERS = MappingProxyType({
+    'Accept-Ranges': 'bytes',
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
+    'Access-Control-Allow-Headers': 'Range, Content-Type',
+    'Access-Control-Expose-Headers': 'Content-Range, Content-Length, Accept-Ranges',
+    'Cache-Control': 'public, max-age=3600',
+})
+
+HEAD_UNSUPPORTED_STATUSES = frozenset({403, 405, 501})
+
+PROXY_FORWARD_HEADERS = (
+    'Content-Length', 'Content-Range', 'Content-Encoding', 'ETag', 'Last-Modified'
+)
+
+CORS_PREFLIGHT_HEADERS = MappingProxyType({
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Range, Content-Type',
+    'Access-Control-Max-Age': '86400',
+})
+
+BLOCKED_HOSTNAMES = frozenset({'localhost', 'localhost.localdomain', '0.0.0.0'})
+HOST_CACHE = TTLCache(maxsize=1024, ttl=300)
+HOST_CACHE_LOCK = threading.Lock()
+IP_LITERAL_RE = re.compile(r'^[\d.]+$|:')  # dotted IPv4 or any IPv6
+MEDIA_INFO_CACHE = TTLCache(maxsize=256, ttl=600)
+MEDIA_INFO_LOCK = threading.Lock()
+
+# Cap concurrent FFmpeg processes so load can't exhaust CPU/memory.
+# A slot is held for the whole stream, so an /api/stream remux keeps one
+# for the full playback; the default never drops below 4 so one player can
+# still fetch subtitles or switch audio tracks while a remux is running.
+# The semaphore (like the caches above) lives in each worker process, so
+# MAX_FFMPEG is a per-worker limit; by default the CPUs are split across
+# the WEB_CONCURRENCY gunicorn workers.
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', 1))
+MAX_FFMPEG = int(os.environ.get(
+    'MAX_FFMPEG', max(4, (os.cpu_count() or 2) // WEB_CONCURRENCY)
+))
+FFMPEG_SEM = threading.BoundedSemaphore(MAX_FFMPEG)
+FFMPEG_SLOT_TIMEOUT = 5
+
+# Shared upstream client; HTTP/2 multiplexes range requests over one
+# connection per host and HTTP/1.1 hosts still get pooled keep-alive.
+UPSTREAM = httpx.Client(
+    http2=True,
+    timeout=REQUEST_TIMEOUT,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+)
 
 # ============================================
 # Helper Functions
 # ============================================
 
+def is_blocked_ip(ip) -> bool:
+    """Check if an IP address belongs to a non-public range."""
+    return (ip.is_private or ip.is_loopback or ip.is_link_local
+            or ip.is_reserved or ip.is_unspecified)
+
+
 def is_private_ip(hostname: str) -> bool:
     """Check if hostname resolves to private IP."""
-    try:
+    if IP_LITERAL_RE.search(hostname):
         try:
-            ip = ip_address(hostname)
-            return any(ip in network for network in BLOCKED_NETWORKS)
+            return is_blocked_ip(ip_address(hostname))
         except ValueError:
-            pass
-        ip_str = socket.gethostbyname(hostname)
-        ip = ip_address(ip_str)
-        return any(ip in network for network in BLOCKED_NETWORKS)
+            # Looks like an IP but isn't a canonical one (e.g. '127.1')
+            return True
+    
+    with HOST_CACHE_LOCK:
+        blocked = HOST_CACHE.get(hostname)
+    if blocked is not None:
+        return blocked
+    
+    try:
+        blocked = is_blocked_ip(ip_address(socket.gethostbyname(hostname)))
     except (socket.gaierror, socket.herror):
+        # Treat as blocked but don't cache, so a DNS hiccup isn't sticky
         return True
+    
+    with HOST_CACHE_LOCK:
+        HOST_CACHE[hostname] = blocked
+    return blocked
 
 
 def validate_url(url: str) -> tuple:
-    """Validate URL for security."""
+    """Validate URL for security. Expects an already-decoded URL."""
     if not url:
         return False, "No URL provided"
     
-    url = unquote(url)
-    
     try:
         parsed = urlparse(url)
     except Exception:
@@ -71,18 +160,18 @@ def validate_url(url: str) -> tuple:
     if not parsed.hostname:
         return False, "Invalid hostname"
     
+    if parsed.hostname.lower() in BLOCKED_HOSTNAMES:
+        return False, "Access to localhost not allowed"
+    
     if is_private_ip(parsed.hostname):
         return False, "Access to internal networks not allowed"
     
-    blocked_hosts = ['localhost', 'localhost.localdomain', '0.0.0.0']
-    if parsed.hostname.lower() in blocked_hosts:
-        return False, "Access to localhost not allowed"
-    
     return True, url
 
 
+@lru_cache(maxsize=1)
 def check_ffmpeg() -> bool:
-    """Check if FFmpeg is installed."""
+    """Check if FFmpeg is installed (cached for the process lifetime)."""
     try:
         subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
         return True
@@ -90,8 +179,9 @@ def check_ffmpeg() -> bool:
         return False
 
 
+@lru_cache(maxsize=1)
 def check_ffprobe() -> bool:
-    """Check if FFprobe is installed."""
+    """Check if FFprobe is installed (cached for the process lifetime)."""
     try:
         subprocess.run(['ffprobe', '-version'], capture_output=True, check=True)
         return True
@@ -99,22 +189,139 @@ def check_ffprobe() -> bool:
         return False
 
 
+def open_ffmpeg(cmd: list) -> subprocess.Popen:
+    """Start FFmpeg with its stdout piped back to us."""
+    process = subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        bufsize=PIPE_READ_SIZE
+    )
+    if fcntl and sys.platform.startswith('linux'):
+        # Enlarge the kernel pipe so FFmpeg doesn't stall between reads
+        try:
+            fcntl.fcntl(process.stdout.fileno(), F_SETPIPE_SZ, PIPE_BUFFER_SIZE)
+        except OSError:
+            pass
+    return process
+
+
+def stop_ffmpeg(process: subprocess.Popen):
+    """Close FFmpeg's pipe and reap the process without blocking for long."""
+    try:
+        process.stdout.close()
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=FFMPEG_STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def iter_pipe(pipe):
+    """Yield FFmpeg output, coalescing whatever is already buffered per chunk."""
+    if os.name != 'posix':
+        while True:
+            chunk = pipe.read(PIPE_READ_SIZE)
+            if not chunk:
+                return
+            yield chunk
+    
+    fd = pipe.fileno()
+    os.set_blocking(fd, False)
+    while True:
+        select.select([fd], [], [])
+        parts = []
+        size = 0
+        eof = False
+        while size < PIPE_BURST_SIZE:
+            try:
+                chunk = os.read(fd, PIPE_READ_SIZE)
+            except BlockingIOError:
+                break
+            if not chunk:
+                eof = True
+                break
+            parts.append(chunk)
+            size += len(chunk)
+        if parts:
+            yield b''.join(parts)
+        if eof:
+            return
+
+
+def stream_ffmpeg(cmd: list, **response_kwargs):
+    """Stream FFmpeg output as a response, holding an FFMPEG_SEM slot meanwhile."""
+    if not FFMPEG_SEM.acquire(timeout=FFMPEG_SLOT_TIMEOUT):
+        return jsonify({'error': 'Server busy, too many FFmpeg jobs running'}), 503
+    
+    slot = [True]
+    
+    def release():
+        if slot:
+            slot.pop()
+            FFMPEG_SEM.release()
+    
+    def generate():
+        process = None
+        try:
+            process = open_ffmpeg(cmd)
+            yield from iter_pipe(process.stdout)
+        finally:
+            try:
+                if process:
+                    stop_ffmpeg(process)
+            finally:
+                release()
+    
+    response = Response(stream_with_context(generate()), **response_kwargs)
+    # Bodies that are never iterated (HEAD, early disconnect) still free the slot
+    response.call_on_close(release)
+    return response
+
+
 def get_media_info(url: str) -> dict:
-    """Get media info using FFprobe."""
+    """Get media info using FFprobe, reusing recent results for the same URL."""
+    with MEDIA_INFO_LOCK:
+        info = MEDIA_INFO_CACHE.get(url)
+    if info is not None:
+        return info
+    
+    info = probe_media(url)
+    if info is not None:
+        with MEDIA_INFO_LOCK:
+            MEDIA_INFO_CACHE[url] = info
+    return info
+
+
+def probe_media(url: str) -> dict:
+    """Run FFprobe against a URL."""
     cmd = [
         'ffprobe',
         '-v', 'quiet',
-        '-print_format', 'json',
+        '-of', 'json=c=1',
         '-show_format',
         '-show_streams',
         url
     ]
     
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
-        if result.returncode != 0:
+        process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        try:
+            output, _ = process.communicate(timeout=120)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            raise
+        if process.returncode != 0:
             return None
-        return json.loads(result.stdout)
+        # orjson parses the raw bytes, no UTF-8 decode pass needed
+        return orjson.loads(output)
     except Exception as e:
         print(f"FFprobe error: {e}")
         return None
@@ -125,13 +332,15 @@ def format_duration(seconds):
     if not seconds:
         return "Unknown"
     try:
-        seconds = float(seconds)
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        secs = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{secs:02d}"
-    except:
+        seconds = int(float(seconds))
+    except (TypeError, ValueError, OverflowError):
         return "Unknown"
+    hours, rem = divmod(seconds, 3600)
+    minutes, secs = divmod(rem, 60)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}"
+
+
+SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB')
 
 
 def format_size(bytes_size):
@@ -140,13 +349,12 @@ def format_size(bytes_size):
         return "Unknown"
     try:
         bytes_size = float(bytes_size)
-        for unit in ['B', 'KB', 'MB', 'GB']:
-            if bytes_size < 1024:
-                return f"{bytes_size:.2f} {unit}"
-            bytes_size /= 1024
-        return f"{bytes_size:.2f} TB"
-    except:
+        whole = int(bytes_size)
+    except (TypeError, ValueError, OverflowError):
         return "Unknown"
+    # Each unit is 2**10 apart, so the bit length picks the unit directly
+    idx = min(4, (whole.bit_length() - 1) // 10) if whole >= 1024 else 0
+    return f"{bytes_size / (1 << (10 * idx)):.2f} {SIZE_UNITS[idx]}"
 
 
 def format_bitrate(bitrate):
@@ -155,19 +363,94 @@ def format_bitrate(bitrate):
         return "Unknown"
     try:
         bitrate = float(bitrate)
-        if bitrate >= 1000000:
-            return f"{bitrate/1000000:.2f} Mbps"
-        elif bitrate >= 1000:
-            return f"{bitrate/1000:.0f} Kbps"
-        return f"{bitrate:.0f} bps"
-    except:
+    except (TypeError, ValueError, OverflowError):
         return "Unknown"
+    if bitrate >= 1000000:
+        return f"{bitrate/1000000:.2f} Mbps"
+    if bitrate >= 1000:
+        return f"{bitrate/1000:.0f} Kbps"
+    return f"{bitrate:.0f} bps"
+
+
+FPS_RE = re.compile(r'^(\d+)/(\d+)$')
+EMPTY_DICT = {}
+
+
+def build_video_stream(s, idx, tags, disp, n):
+    """Build the API entry for a video stream."""
+    fps = s.get('r_frame_rate', 'Unknown')
+    match = FPS_RE.match(fps) if isinstance(fps, str) else None
+    if match:
+        num, den = int(match.group(1)), int(match.group(2))
+        if den != 0:
+            fps = f"{num/den:.2f}"
+    
+    return {
+        'index': idx,
+        'codec': s.get('codec_name', 'Unknown'),
+        'resolution': f"{s.get('width', '?')}x{s.get('height', '?')}",
+        'width': s.get('width', 0),
+        'height': s.get('height', 0),
+        'fps': fps,
+        'bitrate': format_bitrate(s.get('bit_rate')),
+        'title': tags.get('title', f'Video Track {n}')
+    }
+
+
+def build_audio_stream(s, idx, tags, disp, n):
+    """Build the API entry for an audio stream."""
+    return {
+        'index': idx,
+        'codec': s.get('codec_name', 'Unknown'),
+        'language': tags.get('language', 'und'),
+        'title': tags.get('title', f'Audio Track {n}'),
+        'channels': s.get('channels', 2),
+        'sample_rate': s.get('sample_rate', 'Unknown'),
+        'bitrate': format_bitrate(s.get('bit_rate')),
+        'default': disp.get('default', 0) == 1
+    }
+
+
+def build_subtitle_stream(s, idx, tags, disp, n):
+    """Build the API entry for a subtitle stream."""
+    return {
+        'index': idx,
+        'codec': s.get('codec_name', 'Unknown'),
+        'language': tags.get('language', 'und'),
+        'title': tags.get('title', f'Subtitle {n}'),
+        'default': disp.get('default', 0) == 1,
+        'forced': disp.get('forced', 0) == 1
+    }
+
+
+STREAM_BUILDERS = {
+    'video': build_video_stream,
+    'audio': build_audio_stream,
+    'subtitle': build_subtitle_stream,
+}
 
 
 # ============================================
 # Routes - Main
 # ============================================
 
+@app.before_request
+def handle_preflight():
+    """Answer CORS preflight for API routes before any validation or fetch."""
+    if request.method == 'OPTIONS' and request.url_rule and request.path.startswith('/api/'):
+        headers = dict(CORS_PREFLIGHT_HEADERS)
+        headers['Access-Control-Allow-Methods'] = ', '.join(sorted(request.url_rule.methods))
+        return Response(status=204, headers=headers)
+
+
+@app.after_request
+def add_cors_origin(response):
+    """Let cross-origin callers read every API response, JSON ones included."""
+    if request.path.startswith('/api/'):
+        response.headers.setdefault('Access-Control-Allow-Origin', '*')
+    return response
+
+
 @app.route('/')
 def index():
     """Render main page."""
@@ -200,68 +483,70 @@ def proxy_video():
     video_url = result
     
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': '*/*',
-            'Accept-Encoding': 'identity',
-            'Connection': 'keep-alive',
-        }
+        headers = dict(PROXY_REQUEST_HEADERS)
         
         range_header = request.headers.get('Range')
         if range_header:
             headers['Range'] = range_header
         
-        response = requests.get(
-            video_url,
-            headers=headers,
-            timeout=REQUEST_TIMEOUT,
-            stream=True,
-            allow_redirects=True,
-            verify=True
-        )
+        # Players often only probe for length/range support; a HEAD upstream
+        # answers that without opening a body stream.
+        head_only = request.method == 'HEAD'
+        response = None
+        if head_only:
+            response = UPSTREAM.head(video_url, headers=headers)
+            if response.status_code in HEAD_UNSUPPORTED_STATUSES:
+                # Origin (e.g. a presigned GET URL) rejects HEAD; probe with
+                # a streamed GET instead and drop the body unread.
+                response.close()
+                response = None
+        if response is None:
+            response = UPSTREAM.send(
+                UPSTREAM.build_request('GET', video_url, headers=headers),
+                stream=True
+            )
         
-        response.raise_for_status()
+        if response.is_error:
+            # Release the pooled connection before bailing out
+            response.close()
+            response.raise_for_status()
         
-        response_headers = {
-            'Content-Type': response.headers.get('Content-Type', 'video/mp4'),
-            'Accept-Ranges': 'bytes',
-            'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'GET, HEAD, OPTIONS',
-            'Access-Control-Allow-Headers': 'Range, Content-Type',
-            'Access-Control-Expose-Headers': 'Content-Range, Content-Length, Accept-Ranges',
-            'Cache-Control': 'public, max-age=3600',
-        }
+        response_headers = dict(PROXY_RESPONSE_HEADERS)
+        response_headers['Content-Type'] = response.headers.get('Content-Type', 'video/mp4')
+        
+        # Only forward headers upstream actually sent; an empty Content-Length
+        # would break length-aware (sendfile/zero-copy) paths in the server.
+        for name in PROXY_FORWARD_HEADERS:
+            value = response.headers.get(name)
+            if value:
+                response_headers[name] = value
+        
+        status_code = 206 if response.status_code == 206 else 200
+        if status_code != 206:
+            response_headers.pop('Content-Range', None)
         
-        if response.status_code == 206:
-            content_range = response.headers.get('Content-Range')
-            if content_range:
-                response_headers['Content-Range'] = content_range
-            response_headers['Content-Length'] = response.headers.get('Content-Length', '')
-            status_code = 206
-        else:
-            response_headers['Content-Length'] = response.headers.get('Content-Length', '')
-            status_code = 200
+        if head_only:
+            response.close()
+            return Response(status=status_code, headers=response_headers)
         
         def generate():
             try:
-                for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
-                    if chunk:
-                        yield chunk
-            except Exception as e:
+                yield from response.iter_raw(CHUNK_SIZE)
+            except httpx.HTTPError as e:
                 app.logger.error(f"Stream error: {e}")
-            finally:
-                response.close()
         
-        return Response(
-            stream_with_context(generate()),
+        proxied = Response(
+            generate(),
             status=status_code,
             headers=response_headers,
             direct_passthrough=True
         )
+        proxied.call_on_close(response.close)
+        return proxied
     
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         return jsonify({'error': 'Request timed out'}), 504
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         return jsonify({'error': str(e)}), 500
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
@@ -305,64 +590,28 @@ def analyze():
         'bitrate': format_bitrate(fmt.get('bit_rate'))
     }
     
-    video_streams = []
-    audio_streams = []
-    subtitle_streams = []
+    buckets = {'video': [], 'audio': [], 'subtitle': []}
     
     for s in streams:
-        codec_type = s.get('codec_type', '')
-        idx = s.get('index', 0)
-        tags = s.get('tags', {})
-        
-        if codec_type == 'video':
-            fps = s.get('r_frame_rate', 'Unknown')
-            if fps and '/' in str(fps):
-                try:
-                    num, den = map(int, fps.split('/'))
-                    fps = f"{num/den:.2f}" if den != 0 else fps
-                except:
-                    pass
-            
-            video_streams.append({
-                'index': idx,
-                'codec': s.get('codec_name', 'Unknown'),
-                'resolution': f"{s.get('width', '?')}x{s.get('height', '?')}",
-                'width': s.get('width', 0),
-                'height': s.get('height', 0),
-                'fps': fps,
-                'bitrate': format_bitrate(s.get('bit_rate')),
-                'title': tags.get('title', f'Video Track {len(video_streams) + 1}')
-            })
-        
-        elif codec_type == 'audio':
-            audio_streams.append({
-                'index': idx,
-                'codec': s.get('codec_name', 'Unknown'),
-                'language': tags.get('language', 'und'),
-                'title': tags.get('title', f'Audio Track {len(audio_streams) + 1}'),
-                'channels': s.get('channels', 2),
-                'sample_rate': s.get('sample_rate', 'Unknown'),
-                'bitrate': format_bitrate(s.get('bit_rate')),
-                'default': s.get('disposition', {}).get('default', 0) == 1
-            })
-        
-        elif codec_type == 'subtitle':
-            subtitle_streams.append({
-                'index': idx,
-                'codec': s.get('codec_name', 'Unknown'),
-                'language': tags.get('language', 'und'),
-                'title': tags.get('title', f'Subtitle {len(subtitle_streams) + 1}'),
-                'default': s.get('disposition', {}).get('default', 0) == 1,
-                'forced': s.get('disposition', {}).get('forced', 0) == 1
-            })
-    
-    return jsonify({
+        builder = STREAM_BUILDERS.get(s.get('codec_type'))
+        if builder:
+            bucket = buckets[s['codec_type']]
+            bucket.append(builder(
+                s,
+                s.get('index', 0),
+                s.get('tags') or EMPTY_DICT,
+                s.get('disposition') or EMPTY_DICT,
+                len(bucket) + 1
+            ))
+    
+    payload = {
         'success': True,
         'video_info': video_info,
-        'video_streams': video_streams,
-        'audio_streams': audio_streams,
-        'subtitle_streams': subtitle_streams
-    })
+        'video_streams': buckets['video'],
+        'audio_streams': buckets['audio'],
+        'subtitle_streams': buckets['subtitle']
+    }
+    return Response(orjson.dumps(payload), mimetype='application/json')
 
 
 # ============================================
@@ -372,7 +621,7 @@ def analyze():
 @app.route('/api/stream')
 def stream_video_with_audio():
     """Stream video with specific audio track using FFmpeg."""
-    url = unquote(request.args.get('url', ''))
+    url = request.args.get('url', '')
     audio_index = request.args.get('audio', None)
     
     is_valid, result = validate_url(url)
@@ -407,26 +656,8 @@ def stream_video_with_audio():
         'pipe:1'
     ]
     
-    def generate():
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL,
-            bufsize=32768
-        )
-        try:
-            while True:
-                chunk = process.stdout.read(32768)
-                if not chunk:
-                    break
-                yield chunk
-        except GeneratorExit:
-            process.terminate()
-        finally:
-            process.wait()
-    
-    return Response(
-        stream_with_context(generate()),
+    return stream_ffmpeg(
+        cmd,
         mimetype='video/mp4',
         headers={
             'Access-Control-Allow-Origin': '*',
@@ -442,7 +673,7 @@ def stream_video_with_audio():
 @app.route('/api/subtitle')
 def get_subtitle():
     """Extract subtitle track as VTT."""
-    url = unquote(request.args.get('url', ''))
+    url = request.args.get('url', '')
     stream_index = request.args.get('index', '')
     
     if not url or stream_index == '':
@@ -460,6 +691,7 @@ def get_subtitle():
     # Extract as WebVTT for browser compatibility
     cmd = [
         'ffmpeg',
+        '-threads', '1',
         '-i', url,
         '-map', f'0:{stream_index}',
         '-c:s', 'webvtt',
@@ -467,23 +699,8 @@ def get_subtitle():
         'pipe:1'
     ]
     
-    def generate():
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL
-        )
-        try:
-            while True:
-                chunk = process.stdout.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            process.wait()
-    
-    return Response(
-        stream_with_context(generate()),
+    return stream_ffmpeg(
+        cmd,
         mimetype='text/vtt',
         headers={
             'Access-Control-Allow-Origin': '*',
@@ -495,7 +712,7 @@ def get_subtitle():
 @app.route('/api/subtitle/srt')
 def get_subtitle_srt():
     """Extract subtitle track as SRT."""
-    url = unquote(request.args.get('url', ''))
+    url = request.args.get('url', '')
     stream_index = request.args.get('index', '')
     
     if not url or stream_index == '':
@@ -509,6 +726,7 @@ def get_subtitle_srt():
     
     cmd = [
         'ffmpeg',
+        '-threads', '1',
         '-i', url,
         '-map', f'0:{stream_index}',
         '-c:s', 'srt',
@@ -516,23 +734,8 @@ def get_subtitle_srt():
         'pipe:1'
     ]
     
-    def generate():
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL
-        )
-        try:
-            while True:
-                chunk = process.stdout.read(8192)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            process.wait()
-    
-    return Response(
-        stream_with_context(generate()),
+    return stream_ffmpeg(
+        cmd,
         mimetype='text/plain',
         headers={
             'Access-Control-Allow-Origin': '*',
@@ -548,7 +751,7 @@ def get_subtitle_srt():
 @app.route('/api/audio')
 def stream_audio():
     """Stream audio track as MP3."""
-    url = unquote(request.args.get('url', ''))
+    url = request.args.get('url', '')
     stream_index = request.args.get('index', '')
     
     if not url or stream_index == '':
@@ -562,6 +765,7 @@ def stream_audio():
     
     cmd = [
         'ffmpeg',
+        '-threads', '1',
         '-i', url,
         '-map', f'0:{stream_index}',
         '-c:a', 'libmp3lame',
@@ -570,23 +774,8 @@ def stream_audio():
         'pipe:1'
     ]
     
-    def generate():
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.DEVNULL
-        )
-        try:
-            while True:
-                chunk = process.stdout.read(32768)
-                if not chunk:
-                    break
-                yield chunk
-        finally:
-            process.wait()
-    
-    return Response(
-        stream_with_context(generate()),
+    return stream_ffmpeg(
+        cmd,
         mimetype='audio/mpeg',
         headers={'Access-Control-Allow-Origin': '*'}
     )
@@ -633,5 +822,10 @@ if __name__ == '__main__':
         print("   Audio/Subtitle features won't work.")
         print("   Install: https://ffmpeg.org/download.html\n")
     
-if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    # Werkzeug's server is for local development only; in production run
+    # the app under gunicorn (see Procfile) so streams are served concurrently.
+    debug = os.environ.get('FLASK_DEBUG', '0') == '1'
+    if debug:
+        print("⚠️  WARNING: Debug mode is on - do not use this in production!\n")
+    
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file